@@ -1,6 +1,9 @@
 import argparse
+import functools
+import heapq
 import json
 import itertools as it
+import math
 import operator
 import os
 import shlex
@@ -8,6 +11,18 @@ import shutil
 import subprocess
 import sys
 
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+else:
+    # NVML talks to libnvidia-ml.so directly, so no nvidia-smi fork/parse is
+    # needed. If the driver library can't be loaded we fall back to nvidia-smi.
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        pynvml = None
+
 
 __version__ = "1.0.0"
 
@@ -67,7 +82,41 @@ Refer to the [nvidia-smi documentation](https://developer.nvidia.com/nvidia-syst
 
 """
 
+NVIDIA_SMI_GET_GPU_IDS = "nvidia-smi --query-gpu=index,uuid --format=csv,noheader,nounits"
+r"""
+A slim version of `NVIDIA_SMI_GET_GPUS` that only returns the index and UUID of each GPU.
+Used to map the `gpu_uuid` reported by `NVIDIA_SMI_GET_PROCS` back to a GPU index when
+the rest of the GPU metrics are not needed.
+
+**Example Output**:
+    ```
+    0, GPU-12345678-1234-5678-9012-345678901234
+    1, GPU-98765432-9876-5432-2109-876543210987
+    ```
+
+"""
+
+# One shared encoder instead of a json.dumps call (and its option handling) per record
+_ENCODER = json.JSONEncoder(separators=(",", ":")).encode
+
+
 class GPU(object):
+    __slots__ = (
+        "id",
+        "uuid",
+        "gpu_util",
+        "mem_util",
+        "mem_total",
+        "mem_used",
+        "mem_free",
+        "driver",
+        "name",
+        "serial",
+        "display_mode",
+        "display_active",
+        "temperature",
+    )
+
     def __init__(
         self,
         id,
@@ -86,7 +135,7 @@ class GPU(object):
         self.id = id
         self.uuid = uuid
         self.gpu_util = gpu_util
-        self.mem_util = float(mem_used) / float(mem_total) * 100
+        self.mem_util = mem_used / mem_total * 100
         self.mem_total = mem_total
         self.mem_used = mem_used
         self.mem_free = mem_free
@@ -98,15 +147,18 @@ class GPU(object):
         self.temperature = temperature
 
     def __repr__(self):
-        msg = "id: {id} | UUID: {uuid} | gpu_util: {gpu_util:5.1f}% | mem_util: {mem_util:5.1f}% | mem_free: {mem_free:7.1f}MB |  mem_total: {mem_total:7.1f}MB"
-        msg = msg.format(**self.__dict__)
-        return msg
+        return f"id: {self.id} | UUID: {self.uuid} | gpu_util: {self.gpu_util:5.1f}% | mem_util: {self.mem_util:5.1f}% | mem_free: {self.mem_free:7.1f}MB |  mem_total: {self.mem_total:7.1f}MB"
+
+    def _as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
 
     def to_json(self):
-        return json.dumps(self.__dict__)
+        return _ENCODER(self._as_dict())
 
 
 class GPUProcess(object):
+    __slots__ = ("pid", "process_name", "gpu_id", "gpu_uuid", "gpu_name", "used_memory")
+
     def __init__(self, pid, process_name, gpu_id, gpu_uuid, gpu_name, used_memory):
         self.pid = pid
         self.process_name = process_name
@@ -116,100 +168,212 @@ class GPUProcess(object):
         self.used_memory = used_memory
 
     def __repr__(self):
-        msg = "pid: {pid} | gpu_id: {gpu_id} | gpu_uuid: {gpu_uuid} | gpu_name: {gpu_name} | used_memory: {used_memory:7.1f}MB"
-        msg = msg.format(**self.__dict__)
-        return msg
+        return f"pid: {self.pid} | gpu_id: {self.gpu_id} | gpu_uuid: {self.gpu_uuid} | gpu_name: {self.gpu_name} | used_memory: {self.used_memory:7.1f}MB"
+
+    def _as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
 
     def to_json(self):
-        return json.dumps(self.__dict__)
+        return _ENCODER(self._as_dict())
 
 
-def to_float_or_inf(value):
+def _get_gpu(line):
+    # line is the raw (ASCII) bytes of one nvidia-smi row; float() accepts bytes
+    # directly, so only the string-valued fields get decoded.
+    id, uuid, util, mtot, mused, mfree, drv, name, serial, dact, dmode, temp = line.split(b", ")
     try:
-        number = float(value)
+        util, mtot, mused, mfree, temp = map(float, (util, mtot, mused, mfree, temp))
     except ValueError:
-        number = float("nan")
-    return number
+        # nvidia-smi reports unsupported fields as "[N/A]", "[Not Supported]", ...
+        util, mtot, mused, mfree, temp = (
+            math.nan if value.startswith(b"[") else float(value)
+            for value in (util, mtot, mused, mfree, temp)
+        )
+    id, uuid, drv, name, serial, dact, dmode = (
+        field.decode("ascii") for field in (id, uuid, drv, name, serial, dact, dmode)
+    )
+    return GPU(id, uuid, util, mtot, mused, mfree, drv, name, serial, dmode, dact, temp)
 
 
-def _get_gpu(line):
-    values = line.split(", ")
-    id = values[0]
-    uuid = values[1]
-    gpu_util = to_float_or_inf(values[2])
-    mem_total = to_float_or_inf(values[3])
-    mem_used = to_float_or_inf(values[4])
-    mem_free = to_float_or_inf(values[5])
-    driver = values[6]
-    gpu_name = values[7]
-    serial = values[8]
-    display_active = values[9]
-    display_mode = values[10]
-    temp_gpu = to_float_or_inf(values[11])
-    gpu = GPU(
-        id,
-        uuid,
-        gpu_util,
-        mem_total,
-        mem_used,
-        mem_free,
-        driver,
-        gpu_name,
-        serial,
-        display_mode,
-        display_active,
-        temp_gpu,
+def _nvml_str(value):
+    # older pynvml releases return bytes, newer ones str
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _nvml_query(func, *args, default="[N/A]"):
+    # nvidia-smi prints "[N/A]" for fields a device doesn't support; do the same
+    try:
+        return func(*args)
+    except pynvml.NVMLError:
+        return default
+
+
+def _nvml_feature(func, handle):
+    state = _nvml_query(func, handle, default=None)
+    if state is None:
+        return "[N/A]"
+    return "Enabled" if state == pynvml.NVML_FEATURE_ENABLED else "Disabled"
+
+
+_MIB = 1024 * 1024  # NVML reports bytes, nvidia-smi (nounits) reports MiB
+
+
+def _get_gpus_nvml():
+    driver = _nvml_str(pynvml.nvmlSystemGetDriverVersion())
+    gpus = []
+    for index in range(pynvml.nvmlDeviceGetCount()):
+        handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+        util = _nvml_query(pynvml.nvmlDeviceGetUtilizationRates, handle, default=None)
+        mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+        gpu = GPU(
+            str(index),
+            _nvml_str(pynvml.nvmlDeviceGetUUID(handle)),
+            float(util.gpu) if util is not None else math.nan,
+            mem.total / _MIB,
+            mem.used / _MIB,
+            mem.free / _MIB,
+            driver,
+            _nvml_str(pynvml.nvmlDeviceGetName(handle)),
+            _nvml_str(_nvml_query(pynvml.nvmlDeviceGetSerial, handle)),
+            _nvml_feature(pynvml.nvmlDeviceGetDisplayMode, handle),
+            _nvml_feature(pynvml.nvmlDeviceGetDisplayActive, handle),
+            float(
+                _nvml_query(
+                    pynvml.nvmlDeviceGetTemperature,
+                    handle,
+                    pynvml.NVML_TEMPERATURE_GPU,
+                    default=math.nan,
+                )
+            ),
+        )
+        gpus.append(gpu)
+    return gpus
+
+
+def _get_gpu_processes_nvml():
+    get_procs = getattr(
+        pynvml,
+        "nvmlDeviceGetComputeRunningProcesses_v3",
+        pynvml.nvmlDeviceGetComputeRunningProcesses,
     )
-    return gpu
+    processes = []
+    for index in range(pynvml.nvmlDeviceGetCount()):
+        handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+        gpu_uuid = _nvml_str(pynvml.nvmlDeviceGetUUID(handle))
+        gpu_name = _nvml_str(pynvml.nvmlDeviceGetName(handle))
+        for proc in get_procs(handle):
+            # usedGpuMemory is None when the driver can't attribute memory (e.g. WDDM)
+            used = proc.usedGpuMemory
+            processes.append(
+                GPUProcess(
+                    proc.pid,
+                    _nvml_str(_nvml_query(pynvml.nvmlSystemGetProcessName, proc.pid)),
+                    str(index),
+                    gpu_uuid,
+                    gpu_name,
+                    used / _MIB if used is not None else math.nan,
+                )
+            )
+    return processes
 
 
-def get_gpus():
-    output = subprocess.check_output(shlex.split(NVIDIA_SMI_GET_GPUS))
-    #check_output(): A function within the subprocess module that runs a command and captures its output.
+def _get_gpus_uncached():
+    if pynvml is not None:
+        return _get_gpus_nvml()
+    # Fallback: pynvml isn't installed (or libnvidia-ml couldn't be loaded)
+    output = subprocess.run(
+        shlex.split(NVIDIA_SMI_GET_GPUS), check=True, stdout=subprocess.PIPE
+    ).stdout
+    #run(..., check=True): Runs the command, raising CalledProcessError on a non-zero exit, and captures its stdout.
     #shlex.split(NVIDIA_SMI_GET_GPUS): Splits the command string into a list of arguments, ensuring proper handling of spaces and special characters.
-    #The output of the command (including details like GPU index, UUID, utilization, memory usage, etc.) is captured and stored in the output variable.
+    #The output of the command (including details like GPU index, UUID, utilization, memory usage, etc.) is kept as raw bytes.
 
-    lines = output.decode("utf-8").split(os.linesep)
-    #decodes the output (which is a byte string) from UTF-8 encoding to a regular Unicode string.
-    #It then splits the resulting string into a list of lines using the os.linesep separator (which represents the newline character, \n).
-    #The variable lines now contains a list of individual lines from the decoded output.
+    lines = output.splitlines()
+    #splits the byte string into a list of lines without decoding the whole buffer first; splitlines() handles both \n and \r\n
+    #(nvidia-smi on Windows emits CRLF regardless of os.linesep). Each line is decoded field by field in _get_gpu.
 
-    gpus = (_get_gpu(line) for line in lines if line.strip())
-    return gpus
+    return [_get_gpu(line) for line in lines if line.strip()]
+
+
+@functools.lru_cache(maxsize=1)
+def _gpus_cached():
+    return tuple(_get_gpus_uncached())
+
+
+@functools.lru_cache(maxsize=1)
+def _uuid_to_id():
+    if pynvml is not None or _gpus_cached.cache_info().currsize:
+        # the full GPU list is cheap (NVML) or already cached
+        return {gpu.uuid: gpu.id for gpu in _gpus_cached()}
+    # Only the map is needed: query index,uuid instead of all the GPU metrics
+    output = subprocess.run(
+        shlex.split(NVIDIA_SMI_GET_GPU_IDS), check=True, stdout=subprocess.PIPE
+    ).stdout
+    gpu_uuid_to_id_map = {}
+    for line in output.splitlines():
+        if line.strip():
+            id, uuid = line.decode("ascii").split(", ")
+            gpu_uuid_to_id_map[uuid] = id
+    return gpu_uuid_to_id_map
+
+
+def _refresh():
+    """ Drop the cached GPU list (and what is derived from it) """
+    _gpus_cached.cache_clear()
+    _uuid_to_id.cache_clear()
+
+
+def get_gpus():
+    """ Return the GPUs of this host, queried once per process.
+
+    Long-running callers that need fresh readings should call `_refresh()` first.
+    """
+    return _gpus_cached()
 
 
 def _get_gpu_proc(line, gpu_uuid_to_id_map):
-    values = line.split(", ")
+    values = line.split(b", ")
     pid = int(values[0])
-    process_name = values[1]
-    gpu_uuid = values[2]
-    gpu_name = values[3]
-    used_memory = to_float_or_inf(values[4])
+    # process names are paths and may be non-ASCII
+    process_name = values[1].decode("utf-8")
+    gpu_uuid = values[2].decode("ascii")
+    gpu_name = values[3].decode("ascii")
+    used_memory = math.nan if values[4].startswith(b"[") else float(values[4])
     gpu_id = gpu_uuid_to_id_map.get(gpu_uuid, -1)
     proc = GPUProcess(pid, process_name, gpu_id, gpu_uuid, gpu_name, used_memory)
     return proc
 
 
 def get_gpu_processes():
-    gpu_uuid_to_id_map = {gpu.uuid: gpu.id for gpu in get_gpus()}
-    output = subprocess.check_output(shlex.split(NVIDIA_SMI_GET_PROCS))
-    lines = output.decode("utf-8").split(os.linesep)
+    if pynvml is not None:
+        return _get_gpu_processes_nvml()
+    gpu_uuid_to_id_map = _uuid_to_id()
+    output = subprocess.run(
+        shlex.split(NVIDIA_SMI_GET_PROCS), check=True, stdout=subprocess.PIPE
+    ).stdout
+    lines = output.splitlines()
     processes = [
         _get_gpu_proc(line, gpu_uuid_to_id_map) for line in lines if line.strip()
     ]
     return processes
 
 
+def _is_gpu_within_limits(gpu, gpu_util_max, mem_util_max, mem_free_min):
+    return (
+        gpu.gpu_util <= gpu_util_max
+        and gpu.mem_util <= mem_util_max
+        and gpu.mem_free >= mem_free_min
+    )
+
+
 def is_gpu_available(
     gpu, gpu_util_max, mem_util_max, mem_free_min, include_ids, include_uuids
 ):
+    # cheap numeric comparisons first, set lookups last
     return (
-        True
-        and (gpu.gpu_util <= gpu_util_max)
-        and (gpu.mem_util <= mem_util_max)
-        and (gpu.mem_free >= mem_free_min)
-        and (gpu.id in include_ids)
-        and (gpu.uuid in include_uuids)
+        _is_gpu_within_limits(gpu, gpu_util_max, mem_util_max, mem_free_min)
+        and gpu.id in include_ids
+        and gpu.uuid in include_uuids
     )
 
 
@@ -221,19 +385,25 @@ def get_available_gpus(
     include_uuids=None,
 ):
     """ Return up to `limit` available cpus """
-    # Normalize inputs (include_ids and include_uuis need to be iterables)
-    gpus = list(get_gpus())
-    include_ids = include_ids or [gpu.id for gpu in gpus]
-    include_uuids = include_uuids or [gpu.uuid for gpu in gpus]
+    gpus = get_gpus()
+    if not (include_ids or include_uuids):
+        # every GPU is included, so only the limits need checking
+        return [
+            gpu
+            for gpu in gpus
+            if _is_gpu_within_limits(gpu, gpu_util_max, mem_util_max, mem_free_min)
+        ]
+    # Normalize inputs (include_ids and include_uuids become sets for O(1) lookups)
+    include_ids = frozenset(include_ids or (gpu.id for gpu in gpus))
+    include_uuids = frozenset(include_uuids or (gpu.uuid for gpu in gpus))
     # filter available gpus
-    selectors = (
-        is_gpu_available(
+    return [
+        gpu
+        for gpu in gpus
+        if is_gpu_available(
             gpu, gpu_util_max, mem_util_max, mem_free_min, include_ids, include_uuids
         )
-        for gpu in gpus
-    )
-    available_gpus = it.compress(gpus, selectors)
-    return available_gpus
+    ]
 
 
 def get_parser():
@@ -322,48 +492,66 @@ def get_parser():
 
 def _take(n, iterable):
     "Return first n items of the iterable as a list"
-    return it.islice(iterable, n)
+    return list(it.islice(iterable, n))
 
 
 def is_nvidia_smi_on_path():
     return shutil.which("nvidia-smi")
 
 
+def _write_records(records, as_json):
+    """ Write GPUs/processes to stdout in a single call (a JSON array with --json) """
+    if as_json:
+        sys.stdout.write(_ENCODER([record._as_dict() for record in records]) + "\n")
+    elif records:
+        sys.stdout.write("\n".join(repr(record) for record in records) + "\n")
+
+
 def _nvsmi_ls(args):
-    gpus = list(
-        get_available_gpus(
-            gpu_util_max=args.gpu_util_max,
-            mem_util_max=args.mem_util_max,
-            mem_free_min=args.mem_free_min,
-            include_ids=args.ids,
-            include_uuids=args.uuids,
-        )
+    gpus = get_available_gpus(
+        gpu_util_max=args.gpu_util_max,
+        mem_util_max=args.mem_util_max,
+        mem_free_min=args.mem_free_min,
+        include_ids=args.ids,
+        include_uuids=args.uuids,
     )
-    gpus.sort(key=operator.attrgetter(args.sort))
-    for gpu in _take(args.limit, gpus):
-        output = gpu.to_json() if args.json else gpu
-        print(output)
+    key = operator.attrgetter(args.sort)
+    if args.limit < len(gpus):
+        # partial sort: O(n log k) instead of sorting everything and slicing
+        gpus = heapq.nsmallest(args.limit, gpus, key=key)
+    else:
+        gpus.sort(key=key)
+    _write_records(gpus, args.json)
 
 
 def _nvsmi_ps(args):
     processes = get_gpu_processes()
     if args.ids or args.uuids:
-        for proc in processes:
-            if proc.gpu_id in args.ids or proc.gpu_uuid in args.uuids:
-                output = proc.to_json() if args.json else proc
-                print(output)
-    else:
-        for proc in processes:
-            output = proc.to_json() if args.json else proc
-            print(output)
+        processes = [
+            proc
+            for proc in processes
+            if proc.gpu_id in args.ids or proc.gpu_uuid in args.uuids
+        ]
+    _write_records(processes, args.json)
+
+
+def _uuid_key(uuid):
+    # nvidia-smi prints "GPU-<hex>" (or "MIG-<hex>"); accept any case and a missing prefix
+    key = uuid.lower()
+    return key if key.startswith(("gpu-", "mig-")) else "gpu-" + key
 
 
 def validate_ids_and_uuids(args):
-    gpus = list(get_gpus())
+    if not (args.ids or args.uuids):
+        return
+    gpus = get_gpus()  # cached, shared with ls/ps
     gpu_ids = {gpu.id for gpu in gpus}
-    gpu_uuids = {gpu.uuid for gpu in gpus}
-    invalid_ids = args.ids.difference(gpu_ids)
-    invalid_uuids = args.uuids.difference(gpu_uuids)
+    gpu_uuids = {_uuid_key(gpu.uuid): gpu.uuid for gpu in gpus}
+    # Rewrite the user's uuids into the exact form nvidia-smi reports so the
+    # ls/ps filters match; unknown ones are kept as typed for the error below.
+    args.uuids = {gpu_uuids.get(_uuid_key(uuid), uuid) for uuid in args.uuids}
+    invalid_ids = args.ids - gpu_ids
+    invalid_uuids = args.uuids - set(gpu_uuids.values())
     if invalid_ids:
         sys.exit(f"The following GPU ids are not available: {invalid_ids}")
     if invalid_uuids:
@@ -391,6 +579,6 @@ def _main():
 
 if __name__ == "__main__":
     # cli mode
-    if not is_nvidia_smi_on_path():
+    if pynvml is None and not is_nvidia_smi_on_path():
         sys.exit("Error: Couldn't find 'nvidia-smi' in $PATH: %s" % os.environ["PATH"])
     _main()
\ No newline at end of file